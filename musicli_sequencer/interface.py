@@ -14,19 +14,17 @@ from .song import (
     Song,
     Track,
     number_to_name,
-    CHORDS,
+    CHORDS_BY_PITCH_CLASSES,
     COMMON_NAMES,
     DEFAULT_VELOCITY,
     DRUM_CHANNEL,
-    DRUM_NAMES,
-    DRUM_OFFSET,
+    DRUM_NAMES_BY_NUMBER,
     MAX_VELOCITY,
     NOTES_PER_OCTAVE,
     TOTAL_INSTRUMENTS,
     TOTAL_NOTES,
 )
 
-
 # On some systems, color 8 is gray, but this is not fully standardized
 COLOR_GRAY = 8
 
@@ -265,17 +263,14 @@ def format_notes(notes: list[Note]) -> tuple[str, str]:
                 unique_notes.append(note)
                 semitones.add(note.semitone)
 
-        numbers = [note.number for note in unique_notes]
-        inversion = 0
-        while inversion < len(numbers):
-            intervals = [0]
-            for number in numbers[1:]:
-                intervals.append(
-                    (number - intervals[-1] - numbers[0]) % NOTES_PER_OCTAVE
-                )
-            name_tuple = CHORDS.get(tuple(intervals))
+        for inversion, root_note in enumerate(unique_notes):
+            pitch_classes = frozenset(
+                (semitone - root_note.semitone) % NOTES_PER_OCTAVE
+                for semitone in semitones
+            )
+            name_tuple = CHORDS_BY_PITCH_CLASSES.get(pitch_classes)
             if name_tuple is not None:
-                root = unique_notes[inversion].name
+                root = root_note.name
                 short_name, long_name = name_tuple
                 short_string = root + short_name
                 long_string = root + " " + long_name
@@ -284,8 +279,6 @@ def format_notes(notes: list[Note]) -> tuple[str, str]:
                     short_string += f"/{bass}"
                     long_string += f" over {bass} (inversion {inversion})"
                 return short_string, long_string
-            numbers.append(numbers.pop(0) + NOTES_PER_OCTAVE)
-            inversion += 1
 
     short_string = ""
     long_string = ""
@@ -470,11 +463,8 @@ class Interface:
         for y, note in enumerate(
             range(self.y_offset, self.y_offset + self.height - 1)
         ):
-            semitone = note % NOTES_PER_OCTAVE
-            if semitone in [
-                (number + self.song.key) % NOTES_PER_OCTAVE
-                for number in self.song.scale
-            ]:
+            semitone = (note - self.song.key) % NOTES_PER_OCTAVE
+            if semitone in self.song.scale_set:
                 for x in range(-self.x_offset % 4, self.width - 1, 4):
                     self.window.addstr(self.height - y - 1, x, string, attr)
 
@@ -565,11 +555,8 @@ class Interface:
             range(self.y_offset, self.y_offset + self.height)
         ):
             if self.track.is_drum:
-                drum_number = number - DRUM_OFFSET
-                if 0 <= drum_number < len(DRUM_NAMES):
-                    note_name, _ = DRUM_NAMES[drum_number]
-                else:
-                    note_name = str(number)
+                names = DRUM_NAMES_BY_NUMBER.get(number)
+                note_name = str(number) if names is None else names[0]
             else:
                 note_name = number_to_name(number)
             self.window.addstr(
@@ -1004,13 +991,15 @@ class Interface:
 
         old_x_sidebar_offset = self.x_sidebar_offset
         if self.track.is_drum:
-            self.track.set_channel(self.song.get_open_channel(), self.player)
+            self.song.set_track_channel(
+                self.track, self.song.get_open_channel(), self.player
+            )
         else:
             for index, track in enumerate(self.song.tracks):
                 if track.is_drum:
                     self.message = f"Track {index + 1} is already a drum track"
                     return
-            self.track.set_channel(DRUM_CHANNEL, self.player)
+            self.song.set_track_channel(self.track, DRUM_CHANNEL, self.player)
         self.x_offset += self.x_sidebar_offset - old_x_sidebar_offset
 
         self.message = format_track(self.track_index, self.track)
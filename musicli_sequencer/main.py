@@ -10,7 +10,6 @@ import curses.ascii
 import os
 import os.path
 import sys
-from threading import Thread
 from traceback import format_exc
 from typing import Optional
 
@@ -27,7 +26,7 @@ from .song import (
     NAME_TO_NUMBER,
     SCALES,
 )
-from .player import Player, IMPORT_FLUIDSYNTH, PLAY_EVENT, KILL_EVENT
+from .player import Player, IMPORT_FLUIDSYNTH
 
 # Default files
 DEFAULT_FILE = "untitled.mid"
@@ -80,12 +79,7 @@ def wrapper(stdscr: curses.window) -> None:
     )
 
     if PLAYER is not None:
-        playback_thread = Thread(
-            target=PLAYER.try_play_song, args=[song, CRASH_FILE]
-        )
-        playback_thread.start()
-    else:
-        playback_thread = None
+        PLAYER.start(song, CRASH_FILE)
 
     status = 0
     try:
@@ -97,12 +91,8 @@ def wrapper(stdscr: curses.window) -> None:
             crash_file.write(format_exc())
     finally:
         curses.cbreak()
-        PLAY_EVENT.set()
-        KILL_EVENT.set()
-        if playback_thread is not None:
-            playback_thread.join()
         if PLAYER is not None:
-            PLAYER.synth.delete()
+            PLAYER.close()
         sys.exit(status)
 
 
@@ -1,28 +1,143 @@
+from collections import deque
+import ctypes
+import errno
+from heapq import heapify, heappop, heappush
 import sys
-from threading import Event
-from time import sleep
+from threading import Condition, Thread
+from time import monotonic_ns, perf_counter_ns, sleep
 from traceback import format_exc
+from typing import Callable, Iterable, Optional
 
-from mido import tempo2bpm
+from mido import bpm2tempo
 
 from .song import MessageEvent, Note, Song, DEFAULT_BPM
 
 try:
-    from fluidsynth import Synth
+    from fluidsynth import Sequencer, Synth
 
     IMPORT_FLUIDSYNTH = True
 except ImportError:
     IMPORT_FLUIDSYNTH = False
 
+# Windows sleeps in multiples of the system timer period (15.6 ms by default),
+# which is too coarse for playback; request 1 ms while the player is alive
+WINDOWS_TIMER_PERIOD = 1
+
+
+# Linux can sleep until an absolute deadline, so time spent between reading
+# the clock and going to sleep does not delay the wakeup
+CLOCK_MONOTONIC = 1
+TIMER_ABSTIME = 1
+
+
+class Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+
+clock_nanosleep = None
+if sys.platform.startswith("linux"):
+    try:
+        clock_nanosleep = ctypes.CDLL(None).clock_nanosleep
+        clock_nanosleep.argtypes = [
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.POINTER(Timespec),
+            ctypes.c_void_p,
+        ]
+        clock_nanosleep.restype = ctypes.c_int
+    except AttributeError:
+        pass
+
+# Clock that sleep_until deadlines are measured against
+clock_ns = perf_counter_ns if clock_nanosleep is None else monotonic_ns
+
+
+def sleep_until(deadline_ns: int) -> None:
+    if clock_nanosleep is None:
+        sleep(max(deadline_ns - clock_ns(), 0) / 1e9)
+        return
+    deadline = Timespec(*divmod(deadline_ns, 1_000_000_000))
+    # Interrupted by a signal; the deadline is absolute, so just sleep again
+    while (
+        clock_nanosleep(
+            CLOCK_MONOTONIC, TIMER_ABSTIME, ctypes.byref(deadline), None
+        )
+        == errno.EINTR
+    ):
+        pass
+
+
+# Playback control flags, stored as bits of a single state word so that the
+# playback thread can check all of them with one read
+PLAY_FLAG = 1
+RESTART_FLAG = 2
+KILL_FLAG = 4
+
+
+class ControlState:
+    condition: Condition
+    flags: int
+
+    def __init__(self):
+        self.condition = Condition()
+        self.flags = 0
+
+
+# Like threading.Event, but all events are flags of one shared state, so the
+# playback thread can block on any combination of them with a single wait
+class ControlEvent:
+    state: ControlState
+    flag: int
+
+    def __init__(self, state: ControlState, flag: int):
+        self.state = state
+        self.flag = flag
+
+    def is_set(self) -> bool:
+        return self.state.flags & self.flag != 0
+
+    def set(self) -> None:
+        with self.state.condition:
+            self.state.flags |= self.flag
+            self.state.condition.notify_all()
+
+    def clear(self) -> None:
+        with self.state.condition:
+            self.state.flags &= ~self.flag
+
+
+# Notes are handed to FluidSynth's sequencer this long before they are due,
+# stamped with their exact due time, so the synth plays them on time even if
+# the playback thread wakes up late
+LOOKAHEAD_NS = 20_000_000
+
+# Microseconds per beat until the song sets a tempo, as in set_tempo messages
+DEFAULT_TEMPO = bpm2tempo(DEFAULT_BPM)
+
+# Sources of wakeups in the playback schedule, which is a heap of
+# (time, source) pairs; at equal times, lower sources are handled first, so
+# events are woken ahead of time before a column at the same time is due
+SCHEDULE_EVENT = 0
+SCHEDULE_COLUMN = 1
+
 # Global thread events
-PLAY_EVENT = Event()
-RESTART_EVENT = Event()
-KILL_EVENT = Event()
+CONTROL = ControlState()
+PLAY_EVENT = ControlEvent(CONTROL, PLAY_FLAG)
+RESTART_EVENT = ControlEvent(CONTROL, RESTART_FLAG)
+KILL_EVENT = ControlEvent(CONTROL, KILL_FLAG)
+
+
+def play_or_kill() -> bool:
+    return CONTROL.flags & (PLAY_FLAG | KILL_FLAG) != 0
 
 
 class Player:
     synth: Synth
+    sequencer: Sequencer
+    sequencer_synth: int
     soundfont: int
+    commands: deque[tuple[Callable, tuple]]
+    thread: Optional[Thread]
     playhead: int
     restart_time: int
 
@@ -30,105 +145,271 @@ class Player:
         self.synth = Synth()
         self.synth.start()
         self.soundfont = self.synth.sfload(soundfont)
+        self.sequencer = Sequencer()
+        self.sequencer_synth = self.sequencer.register_fluidsynth(self.synth)
+        # Synth calls made by other threads are queued for the playback
+        # thread, so that FluidSynth is only ever driven from one thread; the
+        # queue is unbounded so that no call is ever dropped
+        self.commands = deque()
+        self.thread = None
 
         self.playhead = 0
         self.restart_time = 0
 
+        if sys.platform == "win32":
+            ctypes.WinDLL("winmm").timeBeginPeriod(WINDOWS_TIMER_PERIOD)
+
+    def start(self, song: Song, crash_file_path: str) -> None:
+        self.thread = Thread(
+            target=self.try_play_song, args=[song, crash_file_path]
+        )
+        self.thread.start()
+
+    def close(self) -> None:
+        KILL_EVENT.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.synth.system_reset()
+        if sys.platform == "win32":
+            ctypes.WinDLL("winmm").timeEndPeriod(WINDOWS_TIMER_PERIOD)
+        self.sequencer.delete()
+        self.synth.delete()
+
     @property
     def playing(self) -> bool:
         return PLAY_EVENT.is_set()
 
+    def send(self, function: Callable, *args) -> None:
+        self.commands.append((function, args))
+        with CONTROL.condition:
+            CONTROL.condition.notify_all()
+
+    def run_commands(self) -> None:
+        while self.commands:
+            function, args = self.commands.popleft()
+            function(*args)
+
+    def has_work(self) -> bool:
+        return len(self.commands) > 0 or play_or_kill()
+
+    def wait_for_play(self) -> None:
+        while True:
+            with CONTROL.condition:
+                CONTROL.condition.wait_for(self.has_work)
+            self.run_commands()
+            if play_or_kill():
+                return
+
     def stop_note(self, note: Note) -> None:
-        self.synth.noteoff(note.channel, note.number)
+        self.send(self.synth.noteoff, note.track.channel, note.number)
 
     def play_note(self, note: Note) -> None:
         if note.on:
-            self.synth.noteon(note.channel, note.number, note.velocity)
+            self.send(
+                self.synth.noteon,
+                note.track.channel,
+                note.number,
+                note.velocity,
+            )
         else:
             self.stop_note(note)
 
     def set_instrument(self, channel: int, bank: int, instrument: int) -> None:
-        self.synth.program_select(channel, self.soundfont, bank, instrument)
+        self.send(
+            self.synth.program_select,
+            channel,
+            self.soundfont,
+            bank,
+            instrument,
+        )
+
+    def stop_notes(self, notes: Iterable[Note], submitted_tick: int) -> None:
+        # Notes are started by the sequencer, so they must be stopped through
+        # it too, after the last note it was given; otherwise a queued note on
+        # could arrive after a direct note off and leave the note hanging.
+        # FluidSynth handles note offs before note ons at the same tick, so
+        # stop one tick later
+        time = max(submitted_tick + 1, self.sequencer.get_tick())
+        for note in notes:
+            self.sequencer.note_off(
+                time,
+                note.track.channel,
+                note.number,
+                dest=self.sequencer_synth,
+            )
 
     def play_song(self, song: Song) -> None:
         while True:
-            bpm = DEFAULT_BPM
-
-            if RESTART_EVENT.is_set():
-                RESTART_EVENT.clear()
-
-            PLAY_EVENT.wait()
+            RESTART_EVENT.clear()
+            self.wait_for_play()
             if KILL_EVENT.is_set():
-                sys.exit(0)
+                return
 
             if len(song) == 0:
                 PLAY_EVENT.clear()
                 continue
 
+            # Hoisted out of the loop; only tempo changes update these
+            ticks_per_beat = song.ticks_per_beat
+            ticks_per_col = song.cols_to_ticks(1)
+            note_on = self.sequencer.note_on
+            note_off = self.sequencer.note_off
+            synth_id = self.sequencer_synth
+            tempo = DEFAULT_TEMPO
+
             song.dirty = False
             self.playhead = self.restart_time
-            next_unit_time = (
-                self.playhead
-                - (self.playhead % song.cols_to_ticks(1))
-                + song.cols_to_ticks(1)
-            )
+            # Wakeups are scheduled in integer nanoseconds, counted from this
+            # pair of clock and song times (moved on tempo changes and pauses)
+            anchor_ns = clock_ns()
+            anchor_time = self.playhead
+            # Deadline and sequencer time of the last events handed to the
+            # sequencer
+            submitted_ns = anchor_ns
+            submitted_tick = self.sequencer.get_tick()
+            # Song time of the last events handed over, so that they are not
+            # handed over again if the song is edited before the playhead
+            # moves on
+            dispatched_time = -1
             event_index = song.get_next_index(self.playhead, inclusive=True)
-            next_event = song[event_index]
-            active_notes = []
+            schedule = [
+                (
+                    self.playhead
+                    - (self.playhead % ticks_per_col)
+                    + ticks_per_col,
+                    SCHEDULE_COLUMN,
+                )
+            ]
+            if event_index < len(song):
+                heappush(schedule, (song[event_index].time, SCHEDULE_EVENT))
+            # Keyed by id, since notes compare equal by value
+            active_notes: dict[int, Note] = {}
             while event_index < len(song):
-                delta = min(next_unit_time, next_event.time) - self.playhead
-                sleep(delta / song.ticks_per_beat / bpm * 60.0)
+                time, source = heappop(schedule)
+                deadline_ns = (
+                    anchor_ns
+                    + (time - anchor_time) * tempo * 1000 // ticks_per_beat
+                )
+                # Wakeups coinciding with the previous one are already due
+                if time == self.playhead:
+                    pass
+                elif source == SCHEDULE_EVENT:
+                    sleep_until(deadline_ns - LOOKAHEAD_NS)
+                else:
+                    sleep_until(deadline_ns)
 
-                self.playhead += delta
+                self.playhead = time
 
-                if self.playhead == next_unit_time:
-                    next_unit_time += song.cols_to_ticks(1)
+                if source == SCHEDULE_COLUMN:
+                    heappush(schedule, (time + ticks_per_col, SCHEDULE_COLUMN))
 
-                if not PLAY_EVENT.is_set():
-                    for note in active_notes:
-                        self.stop_note(note)
-                    PLAY_EVENT.wait()
-                if RESTART_EVENT.is_set():
-                    break
-                if KILL_EVENT.is_set():
-                    sys.exit(0)
+                # Only look at individual flags if anything besides play is set
+                if CONTROL.flags != PLAY_FLAG:
+                    if not PLAY_EVENT.is_set():
+                        sleep_until(submitted_ns)
+                        self.stop_notes(active_notes.values(), submitted_tick)
+                        active_notes.clear()
+                        self.wait_for_play()
+                        anchor_ns = clock_ns()
+                        anchor_time = time
+                        deadline_ns = anchor_ns
+                    if RESTART_EVENT.is_set() or KILL_EVENT.is_set():
+                        break
+
+                if self.commands:
+                    self.run_commands()
 
                 if song.dirty:
-                    event_index = song.get_next_index(self.playhead)
+                    event_index = song.get_next_index(
+                        self.playhead,
+                        inclusive=self.playhead != dispatched_time,
+                    )
                     if event_index >= len(song):
                         break
-                    next_event = song[event_index]
+                    # Replace the wakeup for the event that was next before
+                    # the song was edited
+                    schedule = [
+                        entry
+                        for entry in schedule
+                        if entry[1] != SCHEDULE_EVENT
+                    ]
+                    heapify(schedule)
+                    heappush(
+                        schedule,
+                        (song[event_index].time, SCHEDULE_EVENT),
+                    )
                     song.dirty = False
+                    continue
+
+                if source != SCHEDULE_EVENT:
+                    continue
 
+                sequencer_time = self.sequencer.get_tick() + max(
+                    (deadline_ns - clock_ns()) // 1_000_000, 0
+                )
+                submitted_ns = deadline_ns
+                submitted_tick = sequencer_time
+                dispatched_time = time
+
+                # Find all events due now, then hand them over in one pass
+                events = song.events
+                batch_end = event_index
                 while (
-                    event_index < len(song) and self.playhead == next_event.time
+                    batch_end < len(events) and events[batch_end].time == time
                 ):
-                    if isinstance(next_event, Note):
-                        if next_event.on:
-                            active_notes.append(next_event)
-                        elif next_event.pair in active_notes:
-                            active_notes.remove(next_event.pair)
-                        self.play_note(next_event)
-                    elif isinstance(next_event, MessageEvent):
-                        if next_event.message.type == "pitchwheel":
+                    batch_end += 1
+                messages = []
+                for event in events[event_index:batch_end]:
+                    if isinstance(event, Note):
+                        if event.on:
+                            active_notes[id(event)] = event
+                            note_on(
+                                sequencer_time,
+                                event.track.channel,
+                                event.number,
+                                event.velocity,
+                                dest=synth_id,
+                            )
+                        else:
+                            active_notes.pop(id(event.pair), None)
+                            note_off(
+                                sequencer_time,
+                                event.track.channel,
+                                event.number,
+                                dest=synth_id,
+                            )
+                    elif isinstance(event, MessageEvent):
+                        messages.append(event)
+                # The sequencer only queues notes, so once the notes are
+                # queued, wait until other messages are due and send them
+                # directly
+                if messages:
+                    sleep_until(deadline_ns)
+                    for event in messages:
+                        if event.message.type == "pitchwheel":
                             self.synth.pitch_bend(
-                                next_event.track.channel,
-                                next_event.message.pitch,
+                                event.track.channel,
+                                event.message.pitch,
                             )
-                        elif next_event.message.type == "control_change":
+                        elif event.message.type == "control_change":
                             self.synth.cc(
-                                next_event.track.channel,
-                                next_event.message.control,
-                                next_event.message.value,
+                                event.track.channel,
+                                event.message.control,
+                                event.message.value,
                             )
-                        elif next_event.message.type == "set_tempo":
-                            bpm = tempo2bpm(next_event.message.tempo)
-                    event_index += 1
-                    if event_index < len(song):
-                        next_event = song[event_index]
+                        elif event.message.type == "set_tempo":
+                            anchor_ns = deadline_ns
+                            anchor_time = time
+                            tempo = event.message.tempo
+                event_index = batch_end
+                if event_index < len(song):
+                    heappush(
+                        schedule,
+                        (song[event_index].time, SCHEDULE_EVENT),
+                    )
 
-            for note in active_notes:
-                self.stop_note(note)
+            sleep_until(submitted_ns)
+            self.stop_notes(active_notes.values(), submitted_tick)
 
     def try_play_song(self, song, crash_file_path):
         try:
@@ -138,4 +419,3 @@ class Player:
                 crash_file.write(format_exc())
         finally:
             KILL_EVENT.set()
-            sys.exit(1)
@@ -1,6 +1,9 @@
 from __future__ import annotations
-from bisect import bisect_left, bisect_right, insort
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, deque
 from dataclasses import dataclass
+from itertools import accumulate
+from operator import attrgetter, methodcaller
 from typing import Optional, TYPE_CHECKING
 
 if TYPE_CHECKING:
@@ -49,8 +52,31 @@ NAME_TO_NUMBER: dict[str, int] = {
     "B": 11,
 }
 
-SHARP_KEYS: tuple[str, ...] = ("G", "D", "A", "E", "B", "F#", "C#")
-FLAT_KEYS: tuple[str, ...] = ("F", "Bb", "Eb", "Ab", "Db", "Gb")
+# Every note name with and without a common octave, for parsing in one lookup
+FULL_NAME_TO_NUMBER: dict[str, int] = {
+    **NAME_TO_NUMBER,
+    **{
+        f"{name}{octave}": number + octave * NOTES_PER_OCTAVE
+        for name, number in NAME_TO_NUMBER.items()
+        for octave in range(-1, 10)
+    },
+}
+
+# Maps the start of a note name with octave (e.g. "C#" in "C#4" or "C4" in
+# "C4") to the note number and the length of the name without octave, so most
+# names can be parsed with a single lookup
+NAME_PREFIXES: dict[str, tuple[int, int]] = {
+    **{
+        name + char: (number, 1)
+        for name, number in NAME_TO_NUMBER.items()
+        if len(name) == 1
+        for char in "-0123456789"
+    },
+    **{name: (number, len(name)) for name, number in NAME_TO_NUMBER.items()},
+}
+
+SHARP_KEYS: frozenset[str] = frozenset(("G", "D", "A", "E", "B", "F#", "C#"))
+FLAT_KEYS: frozenset[str] = frozenset(("F", "Bb", "Eb", "Ab", "Db", "Gb"))
 
 COMMON_NAMES: tuple[str, ...] = (
     "C",
@@ -97,6 +123,28 @@ FLAT_NAMES: tuple[str, ...] = (
     "B",
 )
 
+# Kinds of key that use sharp or flat names; any other key uses common names
+KIND_BY_KEY: dict[str, int] = {
+    **{key: 1 for key in SHARP_KEYS},
+    **{key: 2 for key in FLAT_KEYS},
+}
+
+# Names indexed by the kind of key they are used in: other, sharp, or flat
+NAMES_BY_KIND: tuple[tuple[str, ...], ...] = (
+    COMMON_NAMES,
+    SHARP_NAMES,
+    FLAT_NAMES,
+)
+
+# Names with octaves for every valid note number, by kind of key
+FULL_NAMES_BY_KIND: tuple[tuple[str, ...], ...] = tuple(
+    tuple(
+        f"{names[number % NOTES_PER_OCTAVE]}{number // NOTES_PER_OCTAVE - 1}"
+        for number in range(TOTAL_NOTES + 1)
+    )
+    for names in NAMES_BY_KIND
+)
+
 # Adapted from:
 # https://en.wikipedia.org/wiki/List_of_musical_scales_and_modes
 SCALES: dict[str, tuple[int, ...]] = {
@@ -110,6 +158,11 @@ SCALES: dict[str, tuple[int, ...]] = {
     "chromatic": (0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11),
 }
 
+# Scales as sets, for membership tests
+SCALE_SETS: dict[str, frozenset[int]] = {
+    name: frozenset(scale) for name, scale in SCALES.items()
+}
+
 # Adapted from:
 # https://en.wikipedia.org/wiki/Interval_(music)
 # https://en.wikipedia.org/wiki/List_of_chords
@@ -137,12 +190,21 @@ CHORDS: dict[tuple[int, ...], tuple[str, str]] = {
     (0, 4, 3, 4): ("maj7", "major seventh chord"),
     (0, 3, 4, 3): ("min7", "minor seventh chord"),
     (0, 3, 4, 4): ("minmaj7", "minor major seventh chord"),
-    (0, 4, 3, 3, 3): ("9", "dominant ninth chord"),
-    (0, 4, 3, 3, 4): ("7b9", "dominant minor ninth chord"),
-    (0, 4, 3, 4, 4): ("maj9", "major ninth chord"),
+    (0, 4, 3, 3, 4): ("9", "dominant ninth chord"),
+    (0, 4, 3, 3, 3): ("7b9", "dominant minor ninth chord"),
+    (0, 4, 3, 4, 3): ("maj9", "major ninth chord"),
     (0, 3, 4, 3, 4): ("min9", "minor ninth chord"),
 }
 
+# Chord names by the pitch classes of their notes relative to the root, so a
+# chord can be identified with one lookup whatever its voicing
+CHORDS_BY_PITCH_CLASSES: dict[frozenset[int], tuple[str, str]] = {
+    frozenset(
+        interval % NOTES_PER_OCTAVE for interval in accumulate(intervals)
+    ): names
+    for intervals, names in CHORDS.items()
+}
+
 # Adapted from:
 # https://en.wikipedia.org/wiki/General_MIDI#Program_change_events
 INSTRUMENT_NAMES: list[str] = [
@@ -329,6 +391,11 @@ DRUM_NAMES: list[tuple[str, str]] = [
     ("OTri", "Open Triangle"),
 ]
 
+# Short and long drum names, by note number
+DRUM_NAMES_BY_NUMBER: dict[int, tuple[str, str]] = {
+    DRUM_OFFSET + index: names for index, names in enumerate(DRUM_NAMES)
+}
+
 DEFAULT_COLS_PER_BEAT = 4
 # These correspond to mido's DEFAULT_TEMPO and DEFAULT_TICKS_PER_BEAT
 # Manually specified to reduce dependency
@@ -343,28 +410,25 @@ DEFAULT_SCALE_NAME = "major"
 def number_to_name(
     number: int, scale: Optional[str] = None, octave: bool = True
 ) -> str:
-    semitone = number % NOTES_PER_OCTAVE
-    if scale in SHARP_KEYS:
-        letter = SHARP_NAMES[semitone]
-    elif scale in FLAT_KEYS:
-        letter = FLAT_NAMES[semitone]
-    else:
-        letter = COMMON_NAMES[semitone]
+    kind = KIND_BY_KEY.get(scale, 0)
     if not octave:
-        return letter
-    octave_str = number // NOTES_PER_OCTAVE - 1
-    return f"{letter}{octave_str}"
+        return NAMES_BY_KIND[kind][number % NOTES_PER_OCTAVE]
+    if 0 <= number <= TOTAL_NOTES:
+        return FULL_NAMES_BY_KIND[kind][number]
+    letter = NAMES_BY_KIND[kind][number % NOTES_PER_OCTAVE]
+    return f"{letter}{number // NOTES_PER_OCTAVE - 1}"
 
 
 def name_to_number(name: str) -> int:
-    number = NAME_TO_NUMBER.get(name[:2])
-    if number is None:
-        number = NAME_TO_NUMBER.get(name[:1])
-        if number is None:
-            raise ValueError(f"{name} is not a valid note name")
-        octave = name[1:]
-    else:
-        octave = name[2:]
+    number = FULL_NAME_TO_NUMBER.get(name)
+    if number is not None:
+        return number
+
+    prefix = NAME_PREFIXES.get(name[:2]) or NAME_PREFIXES.get(name[:1])
+    if prefix is None:
+        raise ValueError(f"{name} is not a valid note name")
+    number, length = prefix
+    octave = name[length:]
 
     if octave == "":
         return number
@@ -375,37 +439,41 @@ def name_to_number(name: str) -> int:
 
 
 class Track:
+    __slots__ = ("channel", "instrument", "is_drum", "bank", "instrument_name")
+
     channel: int
     instrument: int
 
+    # Derived from the channel and instrument, and updated whenever they change
+    is_drum: bool
+    bank: int
+    instrument_name: str
+
     def __init__(self, channel, instrument):
         self.channel = channel
         self.instrument = instrument
+        self.update_derived()
 
-    @property
-    def is_drum(self) -> bool:
-        return self.channel == DRUM_CHANNEL
-
-    @property
-    def bank(self) -> int:
-        return DRUM_BANK if self.is_drum else DEFAULT_BANK
-
-    @property
-    def instrument_name(self) -> str:
+    def update_derived(self) -> None:
+        self.is_drum = self.channel == DRUM_CHANNEL
+        self.bank = DRUM_BANK if self.is_drum else DEFAULT_BANK
         if self.is_drum:
-            return "Drums"
-        return INSTRUMENT_NAMES[self.instrument]
+            self.instrument_name = "Drums"
+        else:
+            self.instrument_name = INSTRUMENT_NAMES[self.instrument]
 
     def register(self, player: Player) -> None:
         player.set_instrument(self.channel, self.bank, self.instrument)
 
     def set_channel(self, channel: int, player: Optional[Player] = None):
         self.channel = channel
+        self.update_derived()
         if player is not None:
             self.register(player)
 
     def set_instrument(self, instrument: int, player: Optional[Player] = None):
         self.instrument = instrument
+        self.update_derived()
         if player is not None:
             self.register(player)
 
@@ -421,6 +489,8 @@ class Track:
 
 @dataclass(init=False)
 class SongEvent:
+    __slots__ = ("time", "track")
+
     time: int
     track: Track
 
@@ -431,6 +501,11 @@ class SongEvent:
         self.time = time
         self.track = track
 
+    # Sorts in an order consistent with the comparison operators, placing
+    # other events before notes at the same time
+    def sort_key(self) -> tuple[int, int, bool]:
+        return (self.time, -1, False)
+
     def __lt__(self, other) -> bool:
         return self.time < other.time
 
@@ -440,6 +515,8 @@ class SongEvent:
 
 @dataclass(init=False)
 class BaseNote(SongEvent):
+    __slots__ = ("number",)
+
     time: int
     track: Track
     number: int
@@ -448,6 +525,9 @@ class BaseNote(SongEvent):
         super().__init__(time, track)
         self.number = number
 
+    def sort_key(self) -> tuple[int, int, bool]:
+        return (self.time, self.number, False)
+
     def __lt__(self, other) -> bool:
         if isinstance(other, BaseNote) and self.time == other.time:
             return self.number < other.number
@@ -467,6 +547,8 @@ class BaseNote(SongEvent):
 
 
 class Note(BaseNote):
+    __slots__ = ("on", "velocity", "pair", "start", "end")
+
     on: bool
     number: int
     time: int
@@ -474,6 +556,12 @@ class Note(BaseNote):
     velocity: int
     pair: Optional[Note]
 
+    # The start and end times of the pair, stored on both notes in the pair
+    # and updated whenever either time changes; an unpaired note starts and
+    # ends at its own time
+    start: int
+    end: int
+
     def __init__(
         self,
         on: bool,
@@ -489,6 +577,7 @@ class Note(BaseNote):
         self.velocity = velocity
 
         self.pair = None
+        self.start = self.end = time
         if duration is not None:
             if duration < 0:
                 raise ValueError(
@@ -514,6 +603,13 @@ class Note(BaseNote):
             track=self.track,
         )
         self.pair.pair = self
+        self.update_times()
+
+    def update_times(self) -> None:
+        on_pair = self.on_pair
+        off_pair = self.off_pair
+        on_pair.start = off_pair.start = on_pair.time
+        on_pair.end = off_pair.end = off_pair.time
 
     @property
     def on_pair(self) -> Note:
@@ -527,17 +623,11 @@ class Note(BaseNote):
             raise ValueError(f"{repr(self)} is not part of a pair")
         return self.pair if self.on else self
 
-    @property
-    def start(self) -> int:
-        return self.on_pair.time
-
-    @property
-    def end(self) -> int:
-        return self.off_pair.time
-
     @property
     def duration(self) -> int:
-        return self.off_pair.time - self.on_pair.time
+        if self.pair is None:
+            raise ValueError(f"{repr(self)} is not part of a pair")
+        return self.end - self.start
 
     @property
     def semitone(self) -> int:
@@ -556,13 +646,11 @@ class Note(BaseNote):
         return self.name_in_key(None, octave=True)
 
     def name_in_key(self, key: Optional[str], octave: bool = False) -> str:
-        if self.is_drum:
-            drum_number = self.number - DRUM_OFFSET
-            if 0 <= drum_number < len(DRUM_NAMES):
-                short_name, long_name = DRUM_NAMES[drum_number]
-            else:
-                short_name = str(self.number)
-                long_name = short_name
+        if self.track.is_drum:
+            names = DRUM_NAMES_BY_NUMBER.get(self.number)
+            if names is None:
+                return str(self.number)
+            short_name, long_name = names
             return long_name if octave else short_name
         return number_to_name(self.number, key, octave=octave)
 
@@ -580,9 +668,8 @@ class Note(BaseNote):
 
     @property
     def instrument_name(self) -> str:
-        if self.is_drum:
-            _, drum_name = DRUM_NAMES[self.number - DRUM_OFFSET]
-            return drum_name
+        if self.track.is_drum:
+            return self.name_in_key(None, octave=True)
         return self.track.instrument_name
 
     def move(self, time: int) -> None:
@@ -595,7 +682,10 @@ class Note(BaseNote):
                     raise ValueError(
                         f"New start time must be non-negative; was {time}"
                     )
-        self.time = time
+            self.time = time
+            self.update_times()
+        else:
+            self.time = self.start = self.end = time
 
     def set_duration(self, duration: int) -> None:
         if duration < 0:
@@ -607,6 +697,7 @@ class Note(BaseNote):
             )
         else:
             self.off_pair.time = self.on_pair.time + duration
+            self.update_times()
 
     def set_velocity(self, velocity: int) -> None:
         if not 0 <= velocity < MAX_VELOCITY:
@@ -626,7 +717,7 @@ class Note(BaseNote):
             note=self.number,
             velocity=self.velocity,
             time=delta,
-            channel=self.channel,
+            channel=self.track.channel,
         )
 
     def __str__(self) -> str:
@@ -639,43 +730,48 @@ class Note(BaseNote):
             f"time={self.time}, "
             f"track={repr(self.track)}, "
             f"velocity={self.velocity}, "
-            f"duration={self.duration})"
+            f"duration={None if self.pair is None else self.duration})"
         )
 
     def __eq__(self, other):
         return (
-            isinstance(other, Note)
-            and self.on == other.on
-            and self.number == other.number
+            other.__class__ is Note
             and self.time == other.time
-            and self.channel == other.channel
+            and self.number == other.number
+            and self.on == other.on
+            and self.track.channel == other.track.channel
         )
 
+    def sort_key(self) -> tuple[int, int, bool]:
+        return (self.time, self.number, self.on)
+
     # Sorting off notes before on notes prevents an unintended staccato effect
     # where a note is played and then immediately stopped by the off event for
     # a note of the same pitch ending at the same time
     # (e.g. 2 back-to-back quarter notes of the same pitch)
 
     def __lt__(self, other):
-        if (
-            isinstance(other, Note)
-            and self.time == other.time
-            and self.number == other.number
-        ):
+        if other.__class__ is Note:
+            if self.time != other.time:
+                return self.time < other.time
+            if self.number != other.number:
+                return self.number < other.number
             return not self.on and other.on
         return super().__lt__(other)
 
     def __gt__(self, other):
-        if (
-            isinstance(other, Note)
-            and self.time == other.time
-            and self.number == other.number
-        ):
+        if other.__class__ is Note:
+            if self.time != other.time:
+                return self.time > other.time
+            if self.number != other.number:
+                return self.number > other.number
             return self.on and not other.on
         return super().__gt__(other)
 
 
 class MessageEvent(SongEvent):
+    __slots__ = ("message",)
+
     def __init__(self, time, message, track=None):
         super().__init__(time, track)
         self.message = message
@@ -694,25 +790,25 @@ class MessageEvent(SongEvent):
         )
 
 
+# Sort key for searching events by time alone
+EVENT_TIME = attrgetter("time")
+
+
 def events_by_track(events):
-    tracks = {}
+    tracks = defaultdict(list)
     for event in events:
         if event.track is not None:
-            if event.track not in tracks:
-                tracks[event.track] = []
             tracks[event.track].append(event)
-    return tracks
+    return dict(tracks)
 
 
-def events_to_messages(events) -> Message:
-    messages = []
-    last_time = 0
-    for event in events:
-        delta = event.time - last_time
-        if isinstance(event, (Note, MessageEvent)):
-            messages.append(event.to_message(delta))
-        last_time = event.time
-    return messages
+def events_to_messages(events) -> list[Message]:
+    times = [event.time for event in events]
+    return [
+        event.to_message(time - last_time)
+        for event, time, last_time in zip(events, times, [0, *times])
+        if isinstance(event, (Note, MessageEvent))
+    ]
 
 
 class Song:
@@ -728,18 +824,22 @@ class Song:
     ):
         self.events = []
         self.tracks = []
+        # Kept up to date by create_track, delete_track and set_track_channel
+        self.tracks_by_channel: dict[int, Track] = {}
+        # Cached by events_by_track until the events change
+        self.events_by_track_cache: Optional[dict] = None
 
+        self.cols_per_beat = cols_per_beat
         if ticks_per_beat is None:
-            self.ticks_per_beat = DEFAULT_TICKS_PER_BEAT
+            self.set_ticks_per_beat(DEFAULT_TICKS_PER_BEAT)
         else:
-            self.ticks_per_beat = ticks_per_beat
+            self.set_ticks_per_beat(ticks_per_beat)
 
         if midi_file is not None:
             self.import_midi(midi_file, player)
         else:
             self.create_track(player=player)
 
-        self.cols_per_beat = cols_per_beat
         self.beats_per_measure = beats_per_measure
         self.key = key
         self.scale_name = scale_name
@@ -755,8 +855,14 @@ class Song:
         return SCALES[self.scale_name]
 
     @property
-    def events_by_track(self) -> list[SongEvent]:
-        return events_by_track(self.events)
+    def scale_set(self) -> frozenset[int]:
+        return SCALE_SETS[self.scale_name]
+
+    @property
+    def events_by_track(self) -> dict[Track, list[SongEvent]]:
+        if self.events_by_track_cache is None:
+            self.events_by_track_cache = events_by_track(self.events)
+        return self.events_by_track_cache
 
     @property
     def start(self) -> int:
@@ -772,16 +878,32 @@ class Song:
     def beats_to_ticks(self, beats: int) -> int:
         return beats * self.ticks_per_beat
 
+    def set_ticks_per_beat(self, ticks_per_beat: int) -> None:
+        self.ticks_per_beat = ticks_per_beat
+        # Columns can be converted with integer arithmetic when each column is
+        # a whole number of ticks
+        ticks_per_col, remainder = divmod(ticks_per_beat, self.cols_per_beat)
+        self.ticks_per_col = (
+            ticks_per_col if ticks_per_col > 0 and remainder == 0 else None
+        )
+
     def ticks_to_cols(self, ticks: int) -> int:
+        if self.ticks_per_col is not None:
+            return ticks // self.ticks_per_col
         return int(ticks / self.ticks_per_beat * self.cols_per_beat)
 
     def cols_to_ticks(self, cols: int) -> int:
+        if self.ticks_per_col is not None:
+            return cols * self.ticks_per_col
         return int(cols / self.cols_per_beat * self.ticks_per_beat)
 
-    def add_note(self, note: Note, pair: bool = True) -> None:
-        index = bisect_left(self.events, note)
+    def add_note(
+        self, note: Note, pair: bool = True, check_duplicate: bool = False
+    ) -> None:
+        index = self.get_insertion_index(note)
         if (
-            0 <= index < len(self)
+            check_duplicate
+            and 0 <= index < len(self)
             and self[index] == note
             and (not pair or self[index].pair == note.pair)
         ):
@@ -790,8 +912,18 @@ class Song:
         if pair:
             if note.pair is None:
                 raise ValueError("Note {note} is unpaired")
-            insort(self.events, note.pair)
+            self.events.insert(self.get_insertion_index(note.pair), note.pair)
         self.dirty = True
+        self.events_by_track_cache = None
+
+    def get_insertion_index(self, event: SongEvent) -> int:
+        # Bisect on time alone, then place the event among the few events at
+        # the same time in the order that import_midi sorts them
+        index = bisect_left(self.events, event.time, key=EVENT_TIME)
+        sort_key = event.sort_key()
+        while index < len(self) and self[index].sort_key() < sort_key:
+            index += 1
+        return index
 
     def remove_note(
         self, note: Note, pair: bool = True, lookup: bool = False
@@ -799,13 +931,28 @@ class Song:
         # Get the song note rather than the given note, since externally
         # created notes may have different pairs
         if lookup:
-            note = self[self.events.index(note)]
-        self.events.remove(note)
+            note = self[self.find_event(note, equal=True)]
+        del self.events[self.find_event(note)]
         if pair:
             if note.pair is None:
                 raise ValueError("Note {song_note} is unpaired")
-            self.events.remove(note.pair)
+            del self.events[self.find_event(note.pair)]
         self.dirty = True
+        self.events_by_track_cache = None
+
+    def find_event(self, event: SongEvent, equal: bool = False) -> int:
+        # Events are sorted by time, so only the events at the same time as the
+        # given event need to be searched
+        index = bisect_left(self.events, event.time, key=EVENT_TIME)
+        while (
+            index < len(self.events) and self.events[index].time == event.time
+        ):
+            if self.events[index] is event or (
+                equal and self.events[index] == event
+            ):
+                return index
+            index += 1
+        raise ValueError(f"{event} is not in the song")
 
     def move_note(self, note: Note, time: int) -> None:
         self.remove_note(note)
@@ -824,9 +971,7 @@ class Song:
         note: bool = False,
         on: bool = False,
     ) -> int:
-        dummy_track = track if track is not None else self.tracks[0]
-        dummy_note = BaseNote(time, dummy_track)
-        index = bisect_left(self, dummy_note)  # type: ignore
+        index = bisect_left(self.events, time, key=EVENT_TIME)
         if not 0 <= index < len(self) or time != self[index].time:
             return len(self)
         while (
@@ -851,9 +996,7 @@ class Song:
         note: bool = False,
         on: bool = False,
     ) -> int:
-        dummy_track = track if track is not None else self.tracks[0]
-        dummy_note = BaseNote(time, dummy_track)
-        index = bisect_left(self, dummy_note) - 1  # type: ignore
+        index = bisect_left(self.events, time, key=EVENT_TIME) - 1
         if not 0 <= index < len(self) or time < self[index].time:
             return len(self)
         while index >= 0 and (
@@ -873,13 +1016,10 @@ class Song:
         inclusive: bool = True,
     ) -> int:
         time = max(time, 0)
-        dummy_track = track if track is not None else self.tracks[0]
         if inclusive:
-            dummy_note = BaseNote(time, dummy_track)
-            index = bisect_left(self, dummy_note)  # type: ignore
+            index = bisect_left(self.events, time, key=EVENT_TIME)
         else:
-            dummy_note = BaseNote(time, dummy_track, number=TOTAL_NOTES)
-            index = bisect_right(self, dummy_note)  # type: ignore
+            index = bisect_right(self.events, time, key=EVENT_TIME)
         if not 0 <= index < len(self) or time > self[index].time:
             return len(self)
         while index < len(self) and (
@@ -923,80 +1063,65 @@ class Song:
 
     def get_chord(self, time: int, track: Optional[Track] = None) -> list[Note]:
         index = self.get_index(time, track, on=True)
-        if not 0 <= index < len(self):
-            return []
-        chord_time = self[index].time
-        chord = [self[index]]
-        index += 1
-        while index < len(self) and self[index].time == chord_time:
-            if (
-                isinstance(self[index], Note)
-                and self[index].on
-                and (track is None or self[index].track is track)
-            ):
-                chord.append(self[index])
-            index += 1
-        return chord
+        return self.get_chord_at_index(index, track)
 
     def get_previous_chord(
         self, time: int, track: Optional[Track] = None
     ) -> list[Note]:
         index = self.get_previous_index(time, track, on=True)
-        if not 0 <= index < len(self):
-            return []
-        chord_time = self[index].time
-        chord = [self[index]]
-        index -= 1
-        while index >= 0 and self[index].time == chord_time:
-            if (
-                isinstance(self[index], Note)
-                and self[index].on
-                and (track is None or self[index].track is track)
-            ):
-                chord.append(self[index])
-            index -= 1
-        return chord
+        return self.get_chord_at_index(index, track, backward=True)
 
     def get_next_chord(
         self, time: int, track: Optional[Track] = None, inclusive: bool = True
     ) -> list[Note]:
         index = self.get_next_index(time, track, on=True, inclusive=inclusive)
+        return self.get_chord_at_index(index, track)
+
+    def get_chord_at_index(
+        self, index: int, track: Optional[Track] = None, backward: bool = False
+    ) -> list[Note]:
         if not 0 <= index < len(self):
             return []
+        # The rest of the chord is in the run of events at the same time, whose
+        # bounds can be found by bisecting on time
         chord_time = self[index].time
-        chord = [self[index]]
-        index += 1
-        while index < len(self) and self[index].time == chord_time:
-            if (
-                isinstance(self[index], Note)
-                and self[index].on
-                and (track is None or self[index].track is track)
-            ):
-                chord.append(self[index])
-            index += 1
-        return chord
+        if backward:
+            start = bisect_left(
+                self.events, chord_time, hi=index, key=EVENT_TIME
+            )
+            run = reversed(self.events[start:index])
+        else:
+            end = bisect_right(
+                self.events, chord_time, lo=index + 1, key=EVENT_TIME
+            )
+            run = self.events[index + 1 : end]
+        return [self[index]] + [
+            event
+            for event in run
+            if isinstance(event, Note)
+            and event.on
+            and (track is None or event.track is track)
+        ]
 
     def get_events_in_track(self, track: Track, notes: bool = False):
-        events = []
-        for event in self.events:
-            if event.track is track and (not notes or isinstance(event, Note)):
-                events.append(event)
-        return events
+        if notes:
+            return [
+                event
+                for event in self.events
+                if event.track is track and isinstance(event, Note)
+            ]
+        return [event for event in self.events if event.track is track]
 
     def has_channel(self, channel: int) -> bool:
-        for track in self.tracks:
-            if track.channel == channel:
-                return True
-        return False
+        return self.get_track(channel, create=False) is not None
 
     def get_open_channel(self) -> int:
-        channels = set()
+        # Bitmask of the channels in use, counting the drum channel as used
+        channels = 1 << DRUM_CHANNEL
         for track in self.tracks:
-            channels.add(track.channel)
-        channel = 0
-        while channel in channels or channel == DRUM_CHANNEL:
-            channel += 1
-        return channel
+            channels |= 1 << track.channel
+        # Isolate the lowest clear bit, which is the lowest open channel
+        return ((channels + 1) & ~channels).bit_length() - 1
 
     def create_track(
         self,
@@ -1009,7 +1134,9 @@ class Song:
         track = Track(channel, instrument)
         track.set_instrument(instrument, player)
         self.tracks.append(track)
+        self.tracks_by_channel[channel] = track
         self.dirty = True
+        self.events_by_track_cache = None
         return track
 
     def get_track(
@@ -1019,21 +1146,32 @@ class Song:
         instrument: int = DEFAULT_INSTRUMENT,
         player: Optional[Player] = None,
     ) -> Optional[Track]:
-        for track in self.tracks:
-            if track.channel == channel:
-                return track
+        track = self.tracks_by_channel.get(channel)
+        if track is not None:
+            return track
         if create:
             return self.create_track(channel, instrument, player)
         return None
 
+    def set_track_channel(
+        self, track: Track, channel: int, player: Optional[Player] = None
+    ) -> None:
+        if self.tracks_by_channel.get(track.channel) is track:
+            del self.tracks_by_channel[track.channel]
+        track.set_channel(channel, player)
+        self.tracks_by_channel[channel] = track
+        # Tracks are hashed by channel, so the grouping must be rebuilt
+        self.events_by_track_cache = None
+
     def delete_track(self, track: Track) -> None:
-        i = 0
-        while i < len(self.events):
-            if self[i].track is track:
-                self.events.pop(i)
-            else:
-                i += 1
+        self.events = [
+            event for event in self.events if event.track is not track
+        ]
         self.tracks.remove(track)
+        if self.tracks_by_channel.get(track.channel) is track:
+            del self.tracks_by_channel[track.channel]
+        self.dirty = True
+        self.events_by_track_cache = None
 
     def import_midi(self, infile_path: str, player: Optional[Player] = None):
         if not IMPORT_MIDO:
@@ -1041,20 +1179,39 @@ class Song:
                 "mido is required to import MIDI files (pip install mido)"
             )
         infile = MidiFile(infile_path)
-        self.ticks_per_beat = infile.ticks_per_beat
+        self.set_ticks_per_beat(infile.ticks_per_beat)
 
         events: list[SongEvent] = []
-        active_notes: list[Note] = []
-        for track in infile.tracks:
+        # Notes waiting for a note_off, by channel and number, oldest first
+        active_notes: defaultdict[tuple[int, int], deque[Note]] = defaultdict(
+            deque
+        )
+        append = events.append
+        # The track for the channel of the last message that needed one
+        channel = None
+        track = None
+        for midi_track in infile.tracks:
             time = 0
-            for message in track:
+            for message in midi_track:
                 time += message.time
-                if message.type == "note_on" and message.velocity > 0:
-                    track = self.get_track(
-                        message.channel, create=True, player=player
-                    )
+                message_type = message.type
+                if message_type == "note_on" and message.velocity == 0:
+                    message_type = "note_off"
+                if message_type in (
+                    "note_on",
+                    "program_change",
+                    "pitchwheel",
+                    "control_change",
+                ):
+                    if message.channel != channel:
+                        channel = message.channel
+                        track = self.get_track(
+                            channel, create=True, player=player
+                        )
                     assert track is not None
-                    active_notes.append(
+
+                if message_type == "note_on":
+                    active_notes[(channel, message.note)].append(
                         Note(
                             on=True,
                             number=message.note,
@@ -1063,33 +1220,23 @@ class Song:
                             track=track,
                         )
                     )
-                elif message.type == "note_off" or (
-                    message.type == "note_on" and message.velocity == 0
-                ):
-                    for note in active_notes.copy():
-                        if note.number == message.note:
-                            duration = time - note.time
-                            note.set_duration(duration)
-                            events.append(note)
-                            assert note.pair is not None
-                            events.append(note.pair)
-                            active_notes.remove(note)
-                            break
-                elif message.type == "program_change":
-                    track = self.get_track(
-                        message.channel, create=True, player=player
-                    )
+                elif message_type == "note_off":
+                    waiting = active_notes.get((message.channel, message.note))
+                    if waiting:
+                        note = waiting.popleft()
+                        note.set_duration(time - note.time)
+                        append(note)
+                        append(note.pair)
+                elif message_type == "program_change":
                     track.set_instrument(message.program, player)
-                elif message.type in ("pitchwheel", "control_change"):
-                    track = self.get_track(
-                        message.channel, create=True, player=player
-                    )
-                    events.append(MessageEvent(time, message, track))
-                elif message.type == "set_tempo":
-                    events.append(MessageEvent(time, message))
+                elif message_type in ("pitchwheel", "control_change"):
+                    append(MessageEvent(time, message, track))
+                elif message_type == "set_tempo":
+                    append(MessageEvent(time, message))
 
-        self.events = sorted(events)
+        self.events = sorted(events, key=methodcaller("sort_key"))
         self.dirty = True
+        self.events_by_track_cache = None
 
     def export_midi(self, filename):
         if not IMPORT_MIDO:
@@ -1108,8 +1255,7 @@ class Song:
                     program=track.instrument,
                 )
             )
-            for message in events_to_messages(events):
-                midi_track.append(message)
+            midi_track.extend(events_to_messages(events))
             outfile.tracks.append(midi_track)
 
         outfile.save(filename)
@@ -1121,4 +1267,8 @@ class Song:
         return self.events[key]
 
     def __contains__(self, item):
-        return item in self.events
+        try:
+            self.find_event(item, equal=True)
+        except ValueError:
+            return False
+        return True